@@ -12,115 +12,235 @@ st.set_page_config(
 
 import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta, timezone
 import plotly.graph_objects as go
 import warnings
 import sys
-import pytz
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-try:
-    from bcb import sgs
-except ImportError:
-    # Fallback para versões antigas
-    import sys
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "bcb==1.1.0"])
-    from bcb import sgs
+# Dependência declarada em requirements.txt (python-bcb)
+from bcb import sgs
 
 # Verificar versão do Python
 st.sidebar.info(f"Python {sys.version}")
 
+# st.fragment só existe no Streamlit >= 1.37 (experimental a partir do 1.33)
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
 # Suprimir warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-def main():
+# Fuso horário de Brasília, resolvido uma única vez
+try:
+    BR_TZ = ZoneInfo('America/Sao_Paulo')
+except ZoneInfoNotFoundError:
+    # Fallback para UTC-3
+    BR_TZ = timezone(timedelta(hours=-3))
 
-    # Configuração inicial com fuso horário
-    def get_brasil_time():
-        """Retorna o horário atual de Brasília (America/Sao_Paulo)"""
-        try:
-            # Método mais robusto com pytz
-            brasil_tz = pytz.timezone('America/Sao_Paulo')
-            return datetime.now(brasil_tz)
-        except:
-            # Fallback para UTC-3
-            return datetime.now(timezone.utc) - timedelta(hours=3)
+def get_brasil_time():
+    """Retorna o horário atual de Brasília (America/Sao_Paulo), fixo durante a execução"""
+    agora = st.session_state.get('_now')
+    if agora is None:
+        agora = datetime.now(BR_TZ)
+        st.session_state['_now'] = agora
+    return agora
+
+# Máximo de pontos enviados ao gráfico (acima disso não há ganho visual)
+MAX_PONTOS_GRAFICO = 2000
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int):
+    """Reduz a série a n_out pontos com Largest-Triangle-Three-Buckets"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
     
+    # Datas viram inteiros para o cálculo das áreas
+    xf = x.astype('int64').astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    yf = y.astype(np.float64)
+    
+    limites = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        # Média do próximo bucket (ou o último ponto)
+        prox_fim = limites[i + 2] if i + 2 < len(limites) else n
+        mx = xf[fim:prox_fim].mean()
+        my = yf[fim:prox_fim].mean()
+        # Ponto do bucket atual que forma o maior triângulo
+        areas = np.abs(
+            (xf[a] - mx) * (yf[inicio:fim] - yf[a])
+            - (xf[a] - xf[inicio:fim]) * (my - yf[a])
+        )
+        a = inicio + int(np.nanargmax(areas)) if not np.all(np.isnan(areas)) else inicio
+        indices[i + 1] = a
+    
+    return x[indices], y[indices]
+
+def main():
+    # Novo "agora" a cada execução completa (cabeçalho e end_date ficam iguais)
+    st.session_state.pop('_now', None)
+
     start_date = '1994-07-01'
     end_date = (get_brasil_time() + timedelta(days=1)).strftime('%Y-%m-%d')
     
     # Dicionário de indicadores
     indicadores = {
-        'Ibovespa': {'codigo': '^BVSP', 'fonte': 'YF', 'unidade': 'Pontos'},
-        'PIB Total': {'codigo': 4380, 'fonte': 'BCB', 'unidade': 'R$ milhões'},
-        'Taxa Selic': {'codigo': 4189, 'fonte': 'BCB', 'unidade': '% ao ano'},
-        'IPCA Mensal': {'codigo': 433, 'fonte': 'BCB', 'unidade': '%'},
-        'Câmbio USD/BRL': {'codigo': 3696, 'fonte': 'BCB', 'unidade': 'R$'},
-        'Taxa de Desemprego': {'codigo': 24369, 'fonte': 'BCB', 'unidade': '%'},
+        'Ibovespa': {'codigo': '^BVSP', 'fonte': 'YF', 'unidade': 'Pontos', 'cor': '#1E88E5', 'fill': None},
+        'PIB Total': {'codigo': 4380, 'fonte': 'BCB', 'unidade': 'R$ milhões', 'cor': '#1E88E5', 'fill': None},
+        'Taxa Selic': {'codigo': 4189, 'fonte': 'BCB', 'unidade': '% ao ano', 'cor': '#FF6B6B', 'fill': 'tozeroy'},
+        'IPCA Mensal': {'codigo': 433, 'fonte': 'BCB', 'unidade': '%', 'cor': '#FF6B6B', 'fill': 'tozeroy'},
+        'Câmbio USD/BRL': {'codigo': 3696, 'fonte': 'BCB', 'unidade': 'R$', 'cor': '#1E88E5', 'fill': None},
+        'Taxa de Desemprego': {'codigo': 24369, 'fonte': 'BCB', 'unidade': '%', 'cor': '#FF6B6B', 'fill': 'tozeroy'},
     }
     
-    # Cache otimizado
-    @st.cache_data(ttl=3600, show_spinner="Carregando dados...")
+    # Sem cache próprio: só é chamada por baixar_dados, que já persiste o resultado
     def fetch_yfinance_data(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """Busca dados do Yahoo Finance com tratamento robusto"""
-        try:
-            # PARA yfinance 1.1.0 - parâmetros corretos
-            data = yf.download(
-                tickers=ticker,
-                start=start_date,
-                end=end_date,
-                auto_adjust=True,
-                progress=False,
-                timeout=30,
-                threads=True
-                # NÃO USAR: show_errors (não existe na 1.1.0)
-            )
-            
-            if data.empty:
-                st.warning(f"⚠️ Nenhum dado encontrado para {ticker}")
-                return pd.DataFrame()
-            
-            # Verifica se temos a coluna Close
-            if 'Close' in data.columns:
-                df_result = data[['Close']].copy()
-                df_result.columns = [ticker]
-                return df_result
-            elif len(data.columns) > 0:
-                # Pega primeira coluna disponível
-                df_result = data.iloc[:, [0]].copy()
-                df_result.columns = [ticker]
-                return df_result
-            
-            return pd.DataFrame()
-            
-        except Exception as e:
-            st.error(f"❌ Erro ao buscar {ticker}: {str(e)}")
-            return pd.DataFrame()
+        """Busca dados do Yahoo Finance; levanta ValueError se não houver dados"""
+        # PARA yfinance 1.1.0 - parâmetros corretos
+        data = yf.download(
+            tickers=ticker,
+            start=start_date,
+            end=end_date,
+            auto_adjust=True,
+            progress=False,
+            timeout=30,
+            threads=False  # Um único ticker: pool de threads seria só overhead
+            # NÃO USAR: show_errors (não existe na 1.1.0)
+        )
+        
+        if data.empty or len(data.columns) == 0:
+            raise ValueError(f"Nenhum dado encontrado para {ticker}")
+        
+        # Verifica se temos a coluna Close; senão pega a primeira disponível
+        if 'Close' in data.columns:
+            df_result = data[['Close']].copy()
+        else:
+            df_result = data.iloc[:, [0]].copy()
+        df_result.columns = [ticker]
+        return df_result
     
-    # Função principal para baixar dados
-    @st.cache_data(ttl=1800)
-    def baixar_dados(indicador_nome: str) -> pd.DataFrame:
-        """Baixa dados do indicador selecionado"""
+    # Função principal para baixar dados, persistida em disco para sobreviver
+    # a reinícios. O Streamlit ignora ttl e max_entries com persist="disk":
+    # end_date entra como argumento para que a chave mude uma vez por dia, e
+    # as entradas antigas (um arquivo .memo por indicador e dia) continuam
+    # no diretório de cache até o botão "Atualizar dados" limpá-lo. Falhas
+    # levantam exceção, e exceções não são guardadas em cache.
+    @st.cache_data(persist="disk", show_spinner=False)
+    def baixar_dados(indicador_nome: str, end_date: str) -> pd.DataFrame:
+        """Baixa dados do indicador selecionado até end_date"""
         indicador_info = indicadores.get(indicador_nome)
         
         if not indicador_info:
-            st.error(f"Indicador {indicador_nome} não encontrado")
-            return pd.DataFrame()
+            raise KeyError(f"Indicador {indicador_nome} não encontrado")
         
+        if indicador_info['fonte'] == 'YF':
+            df = fetch_yfinance_data(indicador_info['codigo'], start_date, end_date)
+        else:
+            # BCB data: uma série por chamada, em paralelo via aquecer_cache
+            df = sgs.get(
+                {indicador_nome: indicador_info['codigo']},
+                start=start_date,
+                end=end_date
+            )
+        
+        # Garante índice crescente (permite inverter a tabela sem ordenar)
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        return df
+    
+    # Resultado (dados, erro) de cada indicador; falhas ficam em memória por
+    # 10 minutos para que uma fonte fora do ar não seja consultada a cada rerun
+    @st.cache_data(ttl=600, max_entries=len(indicadores) * 2, show_spinner=False)
+    def carregar_indicador(indicador_nome: str, end_date: str) -> tuple:
+        """Retorna (dados, mensagem de erro ou None) do indicador"""
         try:
-            if indicador_info['fonte'] == 'YF':
-                return fetch_yfinance_data(indicador_info['codigo'], start_date, end_date)
-            else:
-                # BCB data
-                df = sgs.get(
-                    {indicador_nome: indicador_info['codigo']},
-                    start=start_date,
-                    end=end_date
-                )
-                return df
+            return baixar_dados(indicador_nome, end_date), None
         except Exception as e:
-            st.error(f"Erro ao processar {indicador_nome}: {e}")
-            return pd.DataFrame()
+            return pd.DataFrame(), str(e)
+    
+    # Pré-carrega os indicadores em segundo plano (I/O-bound), uma vez por
+    # dia e por processo, sem bloquear a renderização do indicador atual
+    @st.cache_resource(show_spinner=False)
+    def aquecer_cache(end_date: str) -> dict:
+        """Dispara o download de todos os indicadores em paralelo"""
+        ctx = get_script_run_ctx()
+        # Propaga o contexto do Streamlit para as threads (usado pelo cache)
+        executor = ThreadPoolExecutor(
+            max_workers=len(indicadores),
+            initializer=lambda: add_script_run_ctx(ctx=ctx)
+        )
+        futuros = {
+            nome: executor.submit(carregar_indicador, nome, end_date)
+            for nome in indicadores
+        }
+        # As threads terminam sozinhas após os downloads
+        executor.shutdown(wait=False)
+        return futuros
+    
+    # Só a redução LTTB fica em cache; a figura (até MAX_PONTOS_GRAFICO
+    # pontos) é montada a cada execução, pois um go.Figure em cache seria
+    # reconstruído e revalidado ao ser lido do pickle de qualquer forma
+    @st.cache_data(max_entries=len(indicadores) * 2, show_spinner=False)
+    def reduzir_serie(x: np.ndarray, y: np.ndarray) -> tuple:
+        """Retorna (x, y) reduzidos para o gráfico"""
+        return lttb(x, y, MAX_PONTOS_GRAFICO)
+    
+    def build_fig(nome: str, x: np.ndarray, y: np.ndarray, unidade: str, cor: str, fill) -> go.Figure:
+        """Monta o gráfico de linha do indicador"""
+        fig = go.Figure()
+        
+        # Série completa continua em `dados` para estatísticas e CSV
+        x_ds, y_ds = reduzir_serie(x, y)
+        
+        fig.add_trace(go.Scatter(
+            x=x_ds,
+            y=y_ds,
+            name=nome,
+            line=dict(width=2, color=cor),
+            fill=fill,
+            mode='lines'
+        ))
+        
+        inicio = pd.Timestamp(x.min()).strftime('%d/%m/%Y')
+        fim = pd.Timestamp(x.max()).strftime('%d/%m/%Y')
+        fig.update_layout(
+            title=f"{nome} ({inicio} a {fim})",
+            xaxis_title="Data",
+            yaxis_title=unidade,
+            height=500,
+            hovermode="x unified",
+            template="plotly_white"
+        )
+        return fig
+    
+    # CSV gerado com o writer nativo do pyarrow e mantido em cache
+    @st.cache_data(show_spinner=False)
+    def to_csv_bytes(df: pd.DataFrame) -> bytes:
+        """Serializa o DataFrame (com o índice) em CSV
+
+        Mesmo layout do to_csv(), exceto pelos floats inteiros: o pyarrow
+        grava 100.0 como 100.
+        """
+        # Índice como date32 para gravar "AAAA-MM-DD" em vez do timestamp completo
+        colunas = {df.index.name or '': pa.array(df.index.values.astype('datetime64[D]'))}
+        # from_pandas=True grava NaN como campo vazio, como o pandas
+        colunas.update({str(col): pa.array(df[col].to_numpy(), from_pandas=True) for col in df.columns})
+        
+        buffer = pa.BufferOutputStream()
+        pa_csv.write_csv(
+            pa.table(colunas),
+            buffer,
+            # Cabeçalho sem aspas, como no pandas (nomes e valores não têm vírgulas)
+            write_options=pa_csv.WriteOptions(quoting_style='none')
+        )
+        return buffer.getvalue().to_pybytes()
     
     # Interface
     st.title("📊 Painel de indicadores econômicos")
@@ -141,8 +261,9 @@ def main():
         # Botão de atualização corrigido
         if st.button("🔄 Atualizar dados", type="secondary", use_container_width=True):
             # Limpa cache específico
-            fetch_yfinance_data.clear()
             baixar_dados.clear()
+            carregar_indicador.clear()
+            aquecer_cache.clear()
             st.rerun()
         
         st.divider()
@@ -152,92 +273,88 @@ def main():
         - **Banco Central:** Indicadores macroeconômicos
         """)
     
-    # Layout principal
-    tab1, tab2, tab3 = st.tabs(["📈 Gráfico", "📊 Tabela", "ℹ️ Informações"])
+    aquecer_cache(end_date)
+    with st.spinner("Carregando dados..."):
+        dados, erro = carregar_indicador(indicador_selecionado, end_date)
+    if erro:
+        st.error(f"❌ Erro ao processar {indicador_selecionado}: {erro}")
     
-    with tab1:
-        with st.spinner("Carregando dados..."):
-            dados = baixar_dados(indicador_selecionado)
-        
+    # Fragmentos: interações dentro de cada aba reexecutam só a própria aba
+    @fragment
+    def render_grafico(indicador_selecionado: str, dados: pd.DataFrame):
+        """Métricas e gráfico do indicador"""
         if not dados.empty and len(dados) > 0:
+            # Estatísticas direto no array NumPy (ignora NaN, como o pandas)
+            valores = dados.iloc[:, 0].to_numpy(copy=False)
+            vmin = float(np.nanmin(valores))
+            vmax = float(np.nanmax(valores))
+            vmean = float(np.nanmean(valores, dtype=np.float64))
+        
             col1, col2, col3, col4 = st.columns(4)
-            
+        
             with col1:
-                valor_atual = dados.iloc[-1, 0]
+                valor_atual = valores[-1]
                 delta = None
-                if len(dados) > 1:
+                if valores.size > 1:
                     try:
-                        delta = ((dados.iloc[-1, 0] / dados.iloc[-2, 0]) - 1) * 100
+                        delta = ((valores[-1] / valores[-2]) - 1) * 100
                     except:
                         delta = None
-                
+        
                 st.metric(
                     label="Valor Atual",
                     value=f"{valor_atual:,.2f}",
                     delta=f"{delta:.2f}%" if delta is not None else None,
                     delta_color="normal"
                 )
-            
+        
             with col2:
-                st.metric("Mínimo", f"{dados.min().iloc[0]:,.2f}")
-            
+                st.metric("Mínimo", f"{vmin:,.2f}")
+        
             with col3:
-                st.metric("Máximo", f"{dados.max().iloc[0]:,.2f}")
-            
+                st.metric("Máximo", f"{vmax:,.2f}")
+        
             with col4:
-                st.metric("Média", f"{dados.mean().iloc[0]:,.2f}")
-            
+                st.metric("Média", f"{vmean:,.2f}")
+        
             # Gráfico
-            fig = go.Figure()
-            
-            # Escolhe cor baseada no tipo de indicador
-            if any(x in indicador_selecionado for x in ['Taxa', 'IPCA', 'Desemprego']):
-                cor = '#FF6B6B'
-                fill = 'tozeroy'
-            else:
-                cor = '#1E88E5'
-                fill = None
-            
-            fig.add_trace(go.Scatter(
-                x=dados.index,
-                y=dados[dados.columns[0]],
-                name=indicador_selecionado,
-                line=dict(width=2, color=cor),
-                fill=fill,
-                mode='lines'
-            ))
-            
-            fig.update_layout(
-                title=f"{indicador_selecionado} ({dados.index.min().strftime('%d/%m/%Y')} a {dados.index.max().strftime('%d/%m/%Y')})",
-                xaxis_title="Data",
-                yaxis_title=indicadores[indicador_selecionado]['unidade'],
-                height=500,
-                hovermode="x unified",
-                template="plotly_white"
+            # Cor e preenchimento definidos no dicionário de indicadores
+            info = indicadores[indicador_selecionado]
+            fig = build_fig(
+                indicador_selecionado,
+                dados.index.values,
+                valores,
+                info['unidade'],
+                info['cor'],
+                info['fill']
             )
-            
+        
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.error(f"⚠️ Não foi possível carregar dados para {indicador_selecionado}")
             st.info("Verifique sua conexão com a internet ou tente outro indicador.")
     
-    with tab2:
-        if 'dados' in locals() and not dados.empty:
+    @fragment
+    def render_tabela(indicador_selecionado: str, dados: pd.DataFrame):
+        """Tabela de dados e download em CSV"""
+        if not dados.empty:
             st.subheader("Dados Tabelados")
-            
-            # Formatação
-            dados_display = dados.copy()
-            dados_display.index = dados_display.index.strftime('%d/%m/%Y')
-            dados_display.columns = [f"{indicador_selecionado}"]
-            
+        
+            # Formatação (renomeia sem copiar os dados)
+            dados_display = dados.rename(columns={dados.columns[0]: indicador_selecionado}, copy=False)
+        
+            # Datas formatadas pelo Streamlit no navegador, só nas células visíveis
             st.dataframe(
-                dados_display.sort_index(ascending=False),
+                dados_display.iloc[::-1],
+                column_config={
+                    "_index": st.column_config.DateColumn("Data", format="DD/MM/YYYY")
+                },
                 use_container_width=True,
                 height=400
             )
-            
+        
             # Download
-            csv = dados.to_csv()
+            csv = to_csv_bytes(dados)
             st.download_button(
                 label="📥 Download CSV",
                 data=csv,
@@ -245,7 +362,9 @@ def main():
                 mime="text/csv"
             )
     
-    with tab3:
+    @fragment
+    def render_info(indicador_selecionado: str, dados: pd.DataFrame):
+        """Descrição e metadados do indicador"""
         st.subheader(f"Informações sobre {indicador_selecionado}")
         
         descricoes = {
@@ -265,6 +384,18 @@ def main():
             st.write(f"**Período disponível:** {dados.index.min().strftime('%d/%m/%Y')} a {dados.index.max().strftime('%d/%m/%Y')}")
             st.write(f"**Total de observações:** {len(dados)}")
     
+    # Layout principal
+    tab1, tab2, tab3 = st.tabs(["📈 Gráfico", "📊 Tabela", "ℹ️ Informações"])
+    
+    with tab1:
+        render_grafico(indicador_selecionado, dados)
+    
+    with tab2:
+        render_tabela(indicador_selecionado, dados)
+    
+    with tab3:
+        render_info(indicador_selecionado, dados)
+    
     # Rodapé
     st.divider()
     st.caption("Dashboard desenvolvido com Python • Streamlit • Dados: Yahoo Finance e Banco Central do Brasil")